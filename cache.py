@@ -0,0 +1,79 @@
+# cache.py
+from typing import Optional
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+# Short TTLs: these back endpoints the frontend polls (badges, inbox)
+UNREAD_COUNT_TTL_SECONDS = 10
+INBOX_TTL_SECONDS = 10
+
+# Fail fast when Redis is unreachable so a lookup degrades to a miss instead
+# of blocking the request on the OS connect timeout
+REDIS_TIMEOUT_SECONDS = 0.25
+
+# None when REDIS_URL is not configured — every helper below is then a no-op
+redis_client: Optional[Redis] = None
+
+
+def init_cache(redis_url: Optional[str]) -> bool:
+    global redis_client
+    if not redis_url:
+        return False
+    redis_client = Redis.from_url(
+        redis_url,
+        socket_connect_timeout=REDIS_TIMEOUT_SECONDS,
+        socket_timeout=REDIS_TIMEOUT_SECONDS,
+    )
+    return True
+
+
+async def close_cache() -> None:
+    global redis_client
+    if redis_client is not None:
+        await redis_client.aclose()
+        redis_client = None
+
+
+# ==============================
+# KEYS
+# ==============================
+def unread_key(user_id) -> str:
+    return f"unread:{user_id}"
+
+
+def inbox_key(user_id) -> str:
+    return f"inbox:{user_id}"
+
+
+# ==============================
+# HELPERS
+# ==============================
+async def cache_get(key: str) -> Optional[bytes]:
+    """
+    Return the cached value, or None on a miss. Redis errors count as a miss.
+    """
+    if redis_client is None:
+        return None
+    try:
+        return await redis_client.get(key)
+    except RedisError:
+        return None
+
+
+async def cache_set(key: str, value, ttl: int) -> None:
+    if redis_client is None:
+        return
+    try:
+        await redis_client.set(key, value, ex=ttl)
+    except RedisError:
+        pass
+
+
+async def cache_delete(*keys: str) -> None:
+    if redis_client is None or not keys:
+        return
+    try:
+        await redis_client.delete(*keys)
+    except RedisError:
+        pass
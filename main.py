@@ -1,4 +1,7 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 from beanie import init_beanie
@@ -9,11 +12,48 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
+from cache import close_cache, init_cache
 from models import User, Product, Message
 from routers import users, products, auth, messages, uploads
+from routers.auth import JWTAuthMiddleware, pwd_context
+
+# ==============================
+# Lifespan: database, cache, warm-up
+# ==============================
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    mongo_uri = os.getenv("MONGO_URI")
+    if not mongo_uri:
+        raise ValueError("MONGO_URI environment variable not set.")
+
+    client = AsyncIOMotorClient(
+        mongo_uri,
+        maxPoolSize=200,
+        minPoolSize=20,  # keep warm connections to avoid handshake storms on bursts
+        maxConnecting=4,
+        maxIdleTimeMS=60_000,
+        serverSelectionTimeoutMS=2000,
+        tz_aware=True,  # read datetimes back as UTC-aware, matching what we write
+        compressors="zstd,zlib",  # first one the server also supports wins
+    )
+    db_name = "MarketplaceDB"
+    await init_beanie(database=client[db_name], document_models=[User, Product, Message])
+    print(f"✅ Connected to MongoDB database: {db_name}")
+
+    if init_cache(os.getenv("REDIS_URL")):
+        print("✅ Redis cache enabled")
+
+    # Load the bcrypt backend now rather than on the first login
+    await run_in_threadpool(pwd_context.hash, "warmup")
+
+    yield
+
+    await close_cache()
+    client.close()
+
 
 # ✅ Create ONE FastAPI app instance
-app = FastAPI(title="Marketplace API")
+app = FastAPI(title="Marketplace API", lifespan=lifespan)
 
 # ==============================
 # CORS middleware
@@ -24,28 +64,18 @@ origins = [
     # add more frontend URLs if needed
 ]
 
+# Resolve bearer tokens once per request; added before CORS so CORS stays outermost
+app.add_middleware(JWTAuthMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,  # or ["*"] for dev
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    max_age=7200,  # let browsers cache preflights (Chromium caps at 2h)
 )
 
-# ==============================
-# Database initialization
-# ==============================
-@app.on_event("startup")
-async def startup_event():
-    mongo_uri = os.getenv("MONGO_URI")
-    if not mongo_uri:
-        raise ValueError("MONGO_URI environment variable not set.")
-
-    client = AsyncIOMotorClient(mongo_uri)
-    db_name = "MarketplaceDB"
-    await init_beanie(database=client[db_name], document_models=[User, Product, Message])
-    print(f"✅ Connected to MongoDB database: {db_name}")
-
 # ==============================
 # Routers
 # ==============================
@@ -54,3 +84,19 @@ app.include_router(users.router)
 app.include_router(products.router)
 app.include_router(messages.router)
 app.include_router(uploads.router)
+
+# Fail fast if a router (or a copy of one) gets registered twice
+def _mounted_route_keys(routes, prefix=""):
+    """
+    (path, methods) of every route actually mounted on the app. Newer FastAPI
+    keeps included routers nested instead of copying their routes, so descend.
+    """
+    for route in routes:
+        nested = getattr(route, "original_router", None)
+        if nested is not None:
+            yield from _mounted_route_keys(nested.routes, prefix + route.include_context.prefix)
+        else:
+            yield prefix + route.path, frozenset(getattr(route, "methods", None) or ())
+
+_route_keys = list(_mounted_route_keys(app.router.routes))
+assert len(_route_keys) == len(set(_route_keys)), "Duplicate routes registered"
@@ -1,7 +1,24 @@
-from beanie import Document, Link
-from pydantic import BaseModel, EmailStr, Field, constr
+from beanie import Document, Link, PydanticObjectId
+from pydantic import BaseModel, ConfigDict, EmailStr, Field, constr, field_validator
+from pymongo import ASCENDING, DESCENDING, IndexModel
 from typing import Optional, List
-from datetime import datetime
+from datetime import datetime, timezone
+from functools import partial
+
+
+def link_id(field: str) -> dict:
+    """
+    Aggregation expression for the ObjectId stored in a Link (DBRef) field.
+    "$field.$id" is not a valid field path inside expressions, hence $getField.
+    """
+    return {"$getField": {"field": {"$literal": "$id"}, "input": f"${field}"}}
+
+
+# Timezone-aware UTC "now" for default_factory
+utcnow = partial(datetime.now, timezone.utc)
+
+# Compiled once by pydantic-core when each model using it is built
+PHONE_PATTERN = r"^\+?[0-9]{7,15}$"
 
 
 # -----------------------
@@ -13,15 +30,18 @@ class User(Document):
     last_name: str = Field(..., min_length=2, max_length=30)
     email: EmailStr
     password_hash: str
-    phone_number: Optional[str] = Field(None, pattern=r"^\+?[0-9]{7,15}$")
+    phone_number: Optional[str] = Field(None, pattern=PHONE_PATTERN)
     city: Optional[str] = None
     address: Optional[str] = Field(None, max_length=100)
     role: str = Field(default="user")
     is_active: bool = Field(default=True)
-    date_joined: datetime = Field(default_factory=datetime.utcnow)
+    date_joined: datetime = Field(default_factory=utcnow)
 
     class Settings:
         name = "users"
+        indexes = [
+            IndexModel([("email", ASCENDING)], unique=True),
+        ]
 
 class Product(Document):
     product_name: str = Field(..., max_length=100)
@@ -34,11 +54,14 @@ class Product(Document):
     images: Optional[List[str]] = Field(default_factory=list)   # URLs to product images
     stock_quantity: int = Field(default=0)                      # Available quantity
     is_sold: bool = Field(default=False)                     # Active listing
-    created_at: datetime = Field(default_factory=datetime.utcnow)
-    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: datetime = Field(default_factory=utcnow)
+    updated_at: datetime = Field(default_factory=utcnow)
 
     class Settings:
         name = "products"
+        indexes = [
+            [("seller.$id", ASCENDING)],  # a seller's listings
+        ]
 
 
 # -----------------------
@@ -50,7 +73,7 @@ class UserCreate(BaseModel):
     last_name: constr(strip_whitespace=True, min_length=1)
     email: EmailStr
     password: constr(min_length=6, max_length=128)
-    phone_number: Optional[str] = None
+    phone_number: Optional[str] = Field(None, pattern=PHONE_PATTERN)
     city: Optional[str] = None
     address: Optional[str] = None
 
@@ -64,27 +87,89 @@ class ProductCreate(BaseModel):
     images: Optional[list[str]] = []
     size: Optional[str] = Field(default=None, max_length=16)
 
+class ProductUpdate(BaseModel):
+    """
+    Fields a seller may change; anything else in the body is ignored.
+    """
+    product_name: Optional[str] = Field(None, max_length=100)
+    product_description: Optional[str] = Field(None, max_length=1000)
+    price_usd: Optional[int] = Field(None, ge=0)
+    category: Optional[str] = Field(None, max_length=50)
+    brand: Optional[str] = Field(None, max_length=50)
+    images: Optional[List[str]] = Field(None, max_length=5)  # up to 5 image URLs
+    stock_quantity: Optional[int] = Field(None, ge=0)
+    is_sold: Optional[bool] = None
+    size: Optional[str] = Field(None, max_length=16)
+
+    @field_validator("product_name", "product_description", "price_usd", "stock_quantity", "is_sold")
+    @classmethod
+    def not_null(cls, value):
+        # Required on Product: may be left out of the body, but not cleared
+        if value is None:
+            raise ValueError("may not be null")
+        return value
+
+class ProductSummary(BaseModel):
+    """
+    Product as shown in list views.
+    """
+    id: PydanticObjectId = Field(alias="_id")
+    product_name: str
+    price_usd: int
+    thumbnail: Optional[str] = None
+    seller_id: Optional[PydanticObjectId] = None
+    is_sold: bool = False
+
+    class Settings:
+        projection = {
+            "_id": 1,
+            "product_name": 1,
+            "price_usd": 1,
+            "thumbnail": {"$arrayElemAt": ["$images", 0]},
+            "seller_id": link_id("seller"),
+            "is_sold": 1,
+        }
+
 class UserResponse(BaseModel):
-    id: str
+    """
+    User as returned by the API — everything except password_hash.
+    """
+    model_config = ConfigDict(from_attributes=True, populate_by_name=True)
+
+    id: PydanticObjectId = Field(alias="_id")
     first_name: str
     last_name: str
     email: EmailStr
     phone_number: Optional[str] = None
+    city: Optional[str] = None
     address: Optional[str] = None
     role: str
     is_active: bool
     date_joined: datetime
 
-    class Config:
-        orm_mode = True
-
 class Message(Document):
     sender: Link["User"]
     receiver: Link["User"]
     content: str = Field(..., max_length=1000)
     product: Optional[Link["Product"]] = None  # ← NEW: tie message to a listing
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: datetime = Field(default_factory=utcnow)
     is_read: bool = Field(default=False)
 
     class Settings:
         name = "messages"
+        indexes = [
+            # unread count — partial, so it only holds unread messages
+            IndexModel(
+                [("receiver.$id", ASCENDING), ("is_read", ASCENDING)],
+                name="unread_by_receiver",
+                partialFilterExpression={"is_read": False},
+            ),
+            # my messages, newest first ($or branches)
+            [("sender.$id", ASCENDING), ("created_at", DESCENDING)],
+            [("receiver.$id", ASCENDING), ("created_at", DESCENDING)],
+            # conversation (both directions)
+            [("sender.$id", ASCENDING), ("receiver.$id", ASCENDING), ("created_at", DESCENDING)],
+            [("receiver.$id", ASCENDING), ("sender.$id", ASCENDING), ("created_at", DESCENDING)],
+            # messages about a listing
+            [("product.$id", ASCENDING), ("created_at", DESCENDING)],
+        ]
@@ -1,14 +1,20 @@
 # routers/auth.py
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+import hashlib
 import os
+import time
 
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, Request, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
 from pydantic import BaseModel, EmailStr
 from passlib.context import CryptContext
 from jose import jwt, JWTError
+from cachetools import TTLCache
 from beanie import PydanticObjectId
-from models import UserCreate
+from bson.errors import InvalidId
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from models import UserCreate, UserResponse
 
 from models import User  # Beanie Document
 
@@ -18,13 +24,31 @@ from models import User  # Beanie Document
 SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-change-me")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
+TOKEN_CACHE_TTL_SECONDS = int(os.getenv("TOKEN_CACHE_TTL_SECONDS", "30"))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=12)
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
 
+class _DocumentedBearer(OAuth2PasswordBearer):
+    """
+    Declares the bearer scheme in the OpenAPI schema (so /docs can authorize
+    and generated clients send the token) without parsing the header again:
+    JWTAuthMiddleware has already done that.
+    """
+
+    async def __call__(self, request: Request) -> None:
+        return None
+
+
+oauth2_scheme = _DocumentedBearer(tokenUrl="/auth/login", scheme_name="OAuth2PasswordBearer")
+
+# Verified tokens -> (User, exp), keyed by sha256(token). The short TTL bounds how
+# long role/deactivation changes take to apply; exp is re-checked on every hit.
+_token_cache = TTLCache(maxsize=10_000, ttl=TOKEN_CACHE_TTL_SECONDS)
+
+
 # ==============================
 # SCHEMAS
 # ==============================
@@ -43,14 +67,22 @@ class LoginRequest(BaseModel):
 # ==============================
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
-    now = datetime.utcnow()
+    now = datetime.now(timezone.utc)
     expire = now + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
     to_encode.update({"exp": expire, "iat": now})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
+async def authenticate(token: str) -> User:
+    """
+    Resolve a bearer token to its User, raising 401 if it is invalid.
+    """
+    key = hashlib.sha256(token.encode()).digest()
+    cached = _token_cache.get(key)
+    if cached is not None and cached[1] > time.time():
+        return cached[0]
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: str = payload.get("sub")
@@ -60,11 +92,68 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         user = await User.get(PydanticObjectId(user_id))
         if not user:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+        _token_cache[key] = (user, payload.get("exp", 0))
         return user
-    except JWTError:
+    except (JWTError, InvalidId):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or expired token")
 
 
+async def get_current_user(request: Request, _: None = Depends(oauth2_scheme)) -> User:
+    """
+    Return the user resolved by JWTAuthMiddleware, or 401 (503 if the user
+    lookup itself failed).
+    """
+    state = request.scope.get("state", {})
+    user = state.get("user")
+    if user is None:
+        raise HTTPException(
+            status_code=state.get("auth_status", status.HTTP_401_UNAUTHORIZED),
+            detail=state.get("auth_error", "Not authenticated"),
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user
+
+
+# ==============================
+# MIDDLEWARE
+# ==============================
+class JWTAuthMiddleware:
+    """
+    Pure ASGI middleware: resolves the bearer token once per request and stores
+    the user (or why it was rejected) in scope["state"] for get_current_user.
+    Public routes simply never read it.
+    """
+
+    def __init__(self, app, exclude_paths: tuple = ("/auth/login", "/auth/register")):
+        self.app = app
+        self.exclude_paths = exclude_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and not scope["path"].startswith(self.exclude_paths):
+            token = _bearer_token(scope["headers"])
+            if token:
+                state = scope.setdefault("state", {})
+                try:
+                    state["user"] = await authenticate(token)
+                except HTTPException as exc:
+                    state["auth_error"] = exc.detail
+                except PyMongoError:
+                    # Only routes that need the user should fail on this
+                    state["auth_error"] = "Could not verify token"
+                    state["auth_status"] = status.HTTP_503_SERVICE_UNAVAILABLE
+        await self.app(scope, receive, send)
+
+
+def _bearer_token(headers) -> str | None:
+    for name, value in headers:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer" and token:
+                return token
+            return None
+    return None
+
+
 # ==============================
 # ROUTES
 # ==============================
@@ -72,7 +161,9 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
 @router.post("/login", response_model=Token)
 async def login(request: LoginRequest):
     user = await User.find_one(User.email == request.email)
-    if not user or not pwd_context.verify(request.password, user.password_hash):
+    if not user or not await run_in_threadpool(
+        pwd_context.verify, request.password, user.password_hash
+    ):
         raise HTTPException(status_code=401, detail="Invalid email or password")
 
     token_payload = {
@@ -86,7 +177,7 @@ async def login(request: LoginRequest):
     return {"access_token": token, "token_type": "bearer"}
 
 
-@router.get("/me", response_model=User)
+@router.get("/me", response_model=UserResponse)
 async def get_me(current_user: User = Depends(get_current_user)):
     """
     Return the currently authenticated user's data.
@@ -95,15 +186,9 @@ async def get_me(current_user: User = Depends(get_current_user)):
 
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-@router.post("/register", response_model=User)
+@router.post("/register", response_model=UserResponse)
 async def register_user(user: UserCreate):
-    existing_user = await User.find_one(User.email == user.email)
-    if existing_user:
-        raise HTTPException(status_code=400, detail="Email already registered")
-
-    hashed_pw = pwd_context.hash(user.password)
+    hashed_pw = await run_in_threadpool(pwd_context.hash, user.password)
     new_user = User(
         first_name=user.first_name,
         last_name=user.last_name,
@@ -113,5 +198,8 @@ async def register_user(user: UserCreate):
         city=user.city,
         address=user.address,
     )
-    await new_user.insert()
+    try:
+        await new_user.insert()
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email already registered")
     return new_user
\ No newline at end of file
@@ -1,18 +1,32 @@
 # routers/messages.py
-from datetime import datetime
+import asyncio
+from datetime import datetime, timedelta, timezone
 from typing import List, Optional
 
-from beanie import PydanticObjectId
+import orjson
+from beanie import Link, PydanticObjectId
 from beanie.operators import Or
 from fastapi import APIRouter, Depends, HTTPException, Query
-from pydantic import BaseModel
+from fastapi.responses import Response
+from pydantic import BaseModel, Field
 from pymongo import DESCENDING
 
-from models import Message, Product, User
+from cache import (
+    INBOX_TTL_SECONDS,
+    UNREAD_COUNT_TTL_SECONDS,
+    cache_delete,
+    cache_get,
+    cache_set,
+    inbox_key,
+    unread_key,
+)
+from models import Message, Product, User, link_id
 from routers.auth import get_current_user
 
 router = APIRouter(prefix="/messages", tags=["messages"])
 
+MAX_BULK_MESSAGES = 50
+
 
 # ==============================
 # SCHEMA
@@ -23,21 +37,55 @@ class MessageCreate(BaseModel):
     product_id: Optional[str] = None  # optional: tie message to a listing
 
 
+class MessageView(BaseModel):
+    """
+    Projection of a Message for list views: link ids instead of full links.
+    """
+    id: PydanticObjectId = Field(alias="_id")
+    content: str
+    created_at: datetime
+    is_read: bool
+    sender_id: PydanticObjectId
+    receiver_id: PydanticObjectId
+    product_id: Optional[PydanticObjectId] = None
+
+    class Settings:
+        projection = {
+            "_id": 1,
+            "content": 1,
+            "created_at": 1,
+            "is_read": 1,
+            "sender_id": link_id("sender"),
+            "receiver_id": link_id("receiver"),
+            "product_id": link_id("product"),
+        }
+
+
+class ConversationMessageOut(BaseModel):
+    id: PydanticObjectId
+    content: str
+    sent_by_me: bool
+    is_read: bool
+    created_at: datetime
+
+
+class ConversationOut(BaseModel):
+    other_user: dict
+    product: Optional[dict] = None
+    messages: List[ConversationMessageOut]
+
+
 # ==============================
 # HELPERS
 # ==============================
-async def _product_seller_id(product: Product) -> Optional[str]:
+def _product_seller_id(product: Product) -> Optional[str]:
     """
     Normalize the seller id from a Product.seller link or various stored shapes.
     """
     s = product.seller
-    # Link[User]
-    try:
-        if hasattr(s, "fetch"):
-            doc = await s.fetch()
-            return str(doc.id)
-    except Exception:
-        pass
+    # Link[User] — the id is on the DBRef, no need to fetch the user
+    if isinstance(s, Link):
+        return str(s.ref.id)
 
     # Dict shapes
     if isinstance(s, dict):
@@ -59,67 +107,134 @@ async def _product_seller_id(product: Product) -> Optional[str]:
 # ==============================
 # CREATE MESSAGE
 # ==============================
+async def _create_messages(items: List[MessageCreate], current_user: User) -> List[Message]:
+    """
+    Validate and insert messages from current_user as one batch: one query for
+    all receivers, one for all products, one insert_many.
+    """
+    # Validate ids up front
+    receiver_oids, pids = [], []
+    for data in items:
+        if data.receiver_id == str(current_user.id):
+            raise HTTPException(status_code=400, detail="Cannot send message to yourself")
+        try:
+            receiver_oids.append(PydanticObjectId(data.receiver_id))
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid receiver ID")
+        pid = None
+        if data.product_id:
+            try:
+                pid = PydanticObjectId(data.product_id)
+            except Exception:
+                raise HTTPException(status_code=400, detail="Invalid product ID")
+        pids.append(pid)
+
+    # Receiver and product lookups are independent — run them together.
+    # Receivers only need to exist: fetch just their _id, not whole users.
+    wanted_pids = list({pid for pid in pids if pid})
+    receivers_task = asyncio.create_task(
+        User.get_motor_collection()
+        .find({"_id": {"$in": list(set(receiver_oids))}}, projection={"_id": 1})
+        .to_list(None)
+    )
+    products_task = (
+        asyncio.create_task(Product.find({"_id": {"$in": wanted_pids}}).to_list())
+        if wanted_pids
+        else None
+    )
+    existing_receivers = {doc["_id"] for doc in await receivers_task}
+    products = {p.id: p for p in await products_task} if products_task else {}
+
+    messages = []
+    now = datetime.now(timezone.utc)
+    for i, (data, receiver_oid, pid) in enumerate(zip(items, receiver_oids, pids)):
+        if receiver_oid not in existing_receivers:
+            raise HTTPException(status_code=404, detail="Receiver not found")
+
+        # Optional product tie-in
+        product_doc = None
+        if pid:
+            product_doc = products.get(pid)
+            if not product_doc:
+                raise HTTPException(status_code=404, detail="Product not found")
+
+            # If the item is SOLD, block new buyer messages (seller can still follow up)
+            if product_doc.is_sold:
+                seller_id = _product_seller_id(product_doc)
+                if str(current_user.id) != str(seller_id):
+                    raise HTTPException(
+                        status_code=400,
+                        detail="This item has been sold. Messaging is closed.",
+                    )
+
+        messages.append(
+            Message(
+                id=PydanticObjectId(),  # insert_many does not set ids on the documents
+                sender=User.link_from_id(current_user.id),
+                receiver=User.link_from_id(receiver_oid),
+                content=data.content,
+                product=product_doc,
+                # 1 ms apart (BSON dates keep ms) so batch order and the
+                # `before` cursor stay well-defined
+                created_at=now + timedelta(milliseconds=i),
+            )
+        )
+
+    await Message.insert_many(messages)
+
+    stale_keys = {inbox_key(current_user.id)}
+    for receiver_oid in receiver_oids:
+        stale_keys.update((unread_key(receiver_oid), inbox_key(receiver_oid)))
+    await cache_delete(*stale_keys)
+    return messages
+
+
 @router.post("/", response_model=Message)
 async def send_message(
     data: MessageCreate,
     current_user: User = Depends(get_current_user),
 ):
-    if data.receiver_id == str(current_user.id):
-        raise HTTPException(status_code=400, detail="Cannot send message to yourself")
+    messages = await _create_messages([data], current_user)
+    return messages[0]
 
-    # Validate receiver
-    try:
-        receiver_oid = PydanticObjectId(data.receiver_id)
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid receiver ID")
-    receiver = await User.get(receiver_oid)
-    if not receiver:
-        raise HTTPException(status_code=404, detail="Receiver not found")
-
-    # Optional product tie-in
-    product_doc = None
-    if data.product_id:
-        try:
-            pid = PydanticObjectId(data.product_id)
-        except Exception:
-            raise HTTPException(status_code=400, detail="Invalid product ID")
-        product_doc = await Product.get(pid)
-        if not product_doc:
-            raise HTTPException(status_code=404, detail="Product not found")
 
-        # If the item is SOLD, block new buyer messages (seller can still follow up)
-        if product_doc.is_sold:
-            seller_id = await _product_seller_id(product_doc)
-            if str(current_user.id) != str(seller_id):
-                raise HTTPException(
-                    status_code=400,
-                    detail="This item has been sold. Messaging is closed.",
-                )
-
-    message = Message(
-        sender=current_user,
-        receiver=receiver,
-        content=data.content,
-        product=product_doc,
-        created_at=datetime.utcnow(),
-    )
-    await message.insert()
-    return message
+@router.post("/bulk", response_model=List[Message])
+async def send_messages_bulk(
+    items: List[MessageCreate],
+    current_user: User = Depends(get_current_user),
+):
+    if not items:
+        raise HTTPException(status_code=400, detail="No messages to send")
+    if len(items) > MAX_BULK_MESSAGES:
+        raise HTTPException(status_code=400, detail=f"Max {MAX_BULK_MESSAGES} messages")
+    return await _create_messages(items, current_user)
 
 
 # ==============================
-# GET ALL MESSAGES FOR CURRENT USER (raw stream)
+# MESSAGES FOR CURRENT USER (raw stream, newest first, paginated)
 # ==============================
-@router.get("/", response_model=List[Message])
-async def get_my_messages(current_user: User = Depends(get_current_user)):
-    messages = await Message.find(
-        {
-            "$or": [
-                {"sender.$id": current_user.id},
-                {"receiver.$id": current_user.id},
-            ]
-        }
-    ).sort("-created_at").to_list()
+@router.get("/", response_model=List[MessageView])
+async def get_my_messages(
+    limit: int = Query(default=50, ge=1, le=200),
+    before: Optional[datetime] = Query(default=None, description="Page older than this timestamp"),
+    current_user: User = Depends(get_current_user),
+):
+    query = {
+        "$or": [
+            {"sender.$id": current_user.id},
+            {"receiver.$id": current_user.id},
+        ]
+    }
+    if before:
+        query["created_at"] = {"$lt": before}
+
+    messages = (
+        await Message.find(query)
+        .sort("-created_at")
+        .limit(limit)
+        .project(MessageView)
+        .to_list()
+    )
     return messages
 
 
@@ -128,9 +243,17 @@ async def get_my_messages(current_user: User = Depends(get_current_user)):
 # ==============================
 @router.get("/unread/count")
 async def get_unread_count(current_user: User = Depends(get_current_user)):
-    count = await Message.find(
-        {"receiver.$id": current_user.id, "is_read": False}
-    ).count()
+    key = unread_key(current_user.id)
+    cached = await cache_get(key)
+    if cached is not None:
+        return {"unread_count": int(cached)}
+
+    # Counted from the partial unread index (see Message.Settings.indexes)
+    count = await Message.get_motor_collection().count_documents(
+        {"receiver.$id": current_user.id, "is_read": False},
+        hint="unread_by_receiver",
+    )
+    await cache_set(key, count, UNREAD_COUNT_TTL_SECONDS)
     return {"unread_count": count}
 
 
@@ -139,72 +262,121 @@ async def get_unread_count(current_user: User = Depends(get_current_user)):
 # ==============================
 @router.get("/inbox")
 async def get_inbox(current_user: User = Depends(get_current_user)):
-    # Grab all messages involving me, newest first
-    messages = (
-        await Message.find(
-            Or({"sender.$id": current_user.id}, {"receiver.$id": current_user.id})
-        )
-        .sort([("created_at", DESCENDING)])
-        .to_list()
-    )
-
-    conversations = {}
-    for msg in messages:
-        # Resolve sender/receiver
-        sender = await msg.sender.fetch()
-        receiver = await msg.receiver.fetch()
-        other_user = receiver if sender.id == current_user.id else sender
-        other_user_id = str(other_user.id)
-
-        # Resolve product (if any)
-        product_doc = await msg.product.fetch() if msg.product else None
-        product_id = str(product_doc.id) if product_doc else None
-
-        # Build a key: one conversation per (other_user, product or no_product)
-        key = f"{other_user_id}::{product_id or 'no_product'}"
-        if key not in conversations:
-            preview_text = msg.content[:40] + "..." if len(msg.content) > 40 else msg.content
-
-            # Count unread for this thread (from other -> me, same product context)
-            unread_filter = {
-                "sender.$id": other_user.id,
-                "receiver.$id": current_user.id,
-                "is_read": False,
+    key = inbox_key(current_user.id)
+    cached = await cache_get(key)
+    if cached is not None:
+        return Response(content=cached, media_type="application/json")
+
+    me = current_user.id
+    pipeline = [
+        # All messages involving me
+        {"$match": {"$or": [{"sender.$id": me}, {"receiver.$id": me}]}},
+        # Narrow to what the inbox uses before the sort/group carry documents around
+        {
+            "$project": {
+                "content": 1,
+                "created_at": 1,
+                "is_read": 1,
+                "sender_id": link_id("sender"),
+                "receiver_id": link_id("receiver"),
+                # Messages without a product have it null or missing; unify as null
+                "product_id": {"$ifNull": [link_id("product"), None]},
             }
-            if product_doc:
-                unread_filter["product.$id"] = product_doc.id
-            else:
-                unread_filter["product"] = None
-            unread_count = await Message.find(unread_filter).count()
-
-            conversations[key] = {
-                "user_id": other_user_id,
-                "user_name": f"{other_user.first_name} {other_user.last_name}",
-                "preview": preview_text,
-                "last_message": msg.content,
-                "sent_by_me": sender.id == current_user.id,
-                "timestamp": msg.created_at.isoformat(),
-                "is_read": msg.is_read,
-                "unread_count": unread_count,
+        },
+        {
+            "$addFields": {
+                "other_id": {
+                    "$cond": [{"$eq": ["$sender_id", me]}, "$receiver_id", "$sender_id"]
+                }
+            }
+        },
+        # Newest first, so $first below is the latest message of each thread
+        {"$sort": {"created_at": DESCENDING}},
+        # One conversation per (other_user, product or no_product)
+        {
+            "$group": {
+                "_id": {"other": "$other_id", "product": "$product_id"},
+                "last": {"$first": "$$ROOT"},
+                # Unread for this thread (from other -> me, same product context)
+                "unread_count": {
+                    "$sum": {
+                        "$cond": [
+                            {
+                                "$and": [
+                                    {"$eq": ["$receiver_id", me]},
+                                    {"$eq": ["$is_read", False]},
+                                ]
+                            },
+                            1,
+                            0,
+                        ]
+                    }
+                },
+            }
+        },
+        # Latest first
+        {"$sort": {"last.created_at": DESCENDING}},
+        {
+            "$lookup": {
+                "from": "users",
+                "localField": "_id.other",
+                "foreignField": "_id",
+                "as": "other_user",
+            }
+        },
+        {"$unwind": "$other_user"},
+        {
+            "$lookup": {
+                "from": "products",
+                "localField": "_id.product",
+                "foreignField": "_id",
+                "as": "product",
+            }
+        },
+        {"$unwind": {"path": "$product", "preserveNullAndEmptyArrays": True}},
+        {
+            "$project": {
+                "_id": 0,
+                "user_id": {"$toString": "$_id.other"},
+                "user_name": {
+                    "$concat": ["$other_user.first_name", " ", "$other_user.last_name"]
+                },
+                "preview": {
+                    "$cond": [
+                        {"$gt": [{"$strLenCP": "$last.content"}, 40]},
+                        {"$concat": [{"$substrCP": ["$last.content", 0, 40]}, "..."]},
+                        "$last.content",
+                    ]
+                },
+                "last_message": "$last.content",
+                "sent_by_me": {"$eq": ["$last.sender_id", me]},
+                "timestamp": "$last.created_at",
+                "is_read": "$last.is_read",
+                "unread_count": 1,
                 # Product context for richer inbox UI
-                "product_id": product_id,
-                "product_name": product_doc.product_name if product_doc else None,
-                "product_is_sold": bool(product_doc.is_sold) if product_doc else None,
-                "product_price_usd": product_doc.price_usd if product_doc else None,
-                "product_image": (
-                    (product_doc.images or [None])[0] if product_doc else None
-                ),
+                "product_id": {"$toString": "$_id.product"},
+                "product_name": {"$ifNull": ["$product.product_name", None]},
+                "product_is_sold": {"$ifNull": ["$product.is_sold", None]},
+                "product_price_usd": {"$ifNull": ["$product.price_usd", None]},
+                "product_image": {
+                    "$ifNull": [{"$arrayElemAt": ["$product.images", 0]}, None]
+                },
             }
+        },
+    ]
+    inbox = await Message.aggregate(pipeline).to_list()
 
-    # Latest first
-    inbox = sorted(conversations.values(), key=lambda x: x["timestamp"], reverse=True)
-    return inbox
+    # Rows are plain str/bool/number/datetime values, which orjson encodes natively.
+    # Encode once and cache the exact response body.
+    body = orjson.dumps(inbox)
+    await cache_set(key, body, INBOX_TTL_SECONDS)
+    return Response(content=body, media_type="application/json")
 
 
 # ==============================
 # CONVERSATION (with optional product filter)
 # ==============================
-@router.get("/with/{other_user_id}")
+@router.get("/with/{other_user_id}", response_model=ConversationOut)
 async def get_conversation(
     other_user_id: str,
     product_id: Optional[str] = Query(default=None, alias="product_id"),
@@ -237,30 +409,37 @@ async def get_conversation(
     )
     prod_filter = {"product.$id": product_doc.id} if product_doc else {"product": None}
 
-    messages = (
-        await Message.find({"$and": [base, prod_filter]})
+    # Read the thread and mark received messages as read in parallel. Only
+    # unread messages are matched, so re-opening a read thread writes nothing.
+    messages, _ = await asyncio.gather(
+        Message.find({"$and": [base, prod_filter]})
         .sort("created_at")
-        .to_list()
-    )
-
-    # Serialize thread
-    conversation = []
-    for msg in messages:
-        sender_doc = await msg.sender.fetch()
-        conversation.append(
+        .project(MessageView)
+        .to_list(),
+        Message.find(
             {
-                "id": str(msg.id),
-                "content": msg.content,
-                "sent_by_me": sender_doc.id == current_user.id,
-                "is_read": msg.is_read,
-                "created_at": msg.created_at.isoformat(),
+                "sender.$id": other_user.id,
+                "receiver.$id": current_user.id,
+                "is_read": False,
+                **prod_filter,
             }
+        ).update_many({"$set": {"is_read": True}}),
+    )
+    # Invalidate only once the update has landed, or a poll in between would
+    # re-cache the old unread state
+    await cache_delete(unread_key(current_user.id), inbox_key(current_user.id))
+
+    # Serialize thread (pydantic-core encodes ids and datetimes)
+    conversation = [
+        ConversationMessageOut(
+            id=msg.id,
+            content=msg.content,
+            sent_by_me=msg.sender_id == current_user.id,
+            is_read=msg.is_read,
+            created_at=msg.created_at,
         )
-
-    # Mark received as read for this thread
-    await Message.find(
-        {"sender.$id": other_user.id, "receiver.$id": current_user.id, **prod_filter}
-    ).update_many({"$set": {"is_read": True}})
+        for msg in messages
+    ]
 
     return {
         "other_user": {
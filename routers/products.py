@@ -1,21 +1,22 @@
 # routers/products.py
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Optional
 
-from fastapi import APIRouter, HTTPException, Depends, status
-from beanie import PydanticObjectId
+from fastapi import APIRouter, HTTPException, Depends, Query, status
+from beanie import Link, PydanticObjectId
+from pymongo import ReturnDocument
 
-from models import Product, User, ProductCreate
+from models import Product, User, ProductCreate, ProductSummary, ProductUpdate
 from routers.auth import get_current_user
 
 router = APIRouter(prefix="/products", tags=["products"])
 
 
 # --- Helpers -----------------------------------------------------------------
-async def _extract_seller_id(product: Product) -> Optional[str]:
+def _extract_seller_id(product: Product) -> Optional[str]:
     """
     Normalize the seller id across possible shapes:
-    - Beanie Link(User)  -> fetch() and read doc.id
+    - Beanie Link(User)  -> the DBRef's id (no fetch)
     - {"id": ObjectId}   -> str(value)
     - {"$id": ...}       -> DBRef-like; supports {"$oid": "..."} as well
     - "string_id"        -> as-is
@@ -24,12 +25,8 @@ async def _extract_seller_id(product: Product) -> Optional[str]:
     s = product.seller
 
     # Link[User] (Beanie)
-    try:
-        if hasattr(s, "fetch"):
-            doc = await s.fetch()
-            return str(doc.id)
-    except Exception:
-        pass
+    if isinstance(s, Link):
+        return str(s.ref.id)
 
     # Dict-like shapes
     if isinstance(s, dict):
@@ -48,21 +45,39 @@ async def _extract_seller_id(product: Product) -> Optional[str]:
     return None
 
 
+async def product_oid(product_id: str) -> PydanticObjectId:
+    """
+    Path dependency: parse {product_id} into an ObjectId, or 400.
+    Async so FastAPI calls it inline instead of in the threadpool.
+    """
+    try:
+        return PydanticObjectId(product_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid product ID")
+
+
 # --- Routes ------------------------------------------------------------------
 # GET - Public route (no auth required)
-@router.get("/", response_model=list[Product])
-async def get_products():
-    return await Product.find_all().to_list()
+@router.get("/", response_model=list[ProductSummary])
+async def get_products(
+    skip: int = Query(default=0, ge=0),
+    limit: int = Query(default=50, ge=1, le=200),
+    after: Optional[PydanticObjectId] = Query(default=None, description="Cursor: last id of the previous page"),
+):
+    query = {"_id": {"$gt": after}} if after else {}
+    return (
+        await Product.find(query)
+        .sort("_id")
+        .skip(skip)
+        .limit(limit)
+        .project(ProductSummary)
+        .to_list()
+    )
 
 
 # GET single product - Public
 @router.get("/{product_id}", response_model=Product)
-async def get_product(product_id: str):
-    try:
-        oid = PydanticObjectId(product_id)
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid product ID")
-
+async def get_product(oid: PydanticObjectId = Depends(product_oid)):
     product = await Product.get(oid)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
@@ -95,8 +110,8 @@ async def create_product(
         images=images,
         size=product_data.size,
         seller={"id": current_user.id, "collection": "users"},
-        created_at=datetime.utcnow(),
-        updated_at=datetime.utcnow(),
+        created_at=datetime.now(timezone.utc),
+        updated_at=datetime.now(timezone.utc),
     )
     await product.insert()
     return product
@@ -105,47 +120,23 @@ async def create_product(
 # UPDATE - Protected (only seller or admin)
 @router.put("/{product_id}", response_model=Product)
 async def update_product(
-    product_id: str,
-    update_data: dict,
+    update_data: ProductUpdate,
+    oid: PydanticObjectId = Depends(product_oid),
     current_user: User = Depends(get_current_user),
 ):
-    try:
-        oid = PydanticObjectId(product_id)
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid product ID")
-
     product = await Product.get(oid)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
 
-    seller_id = await _extract_seller_id(product)
+    seller_id = _extract_seller_id(product)
     if str(seller_id) != str(current_user.id) and current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Not authorized")
 
-    if "images" in update_data:
-        imgs = update_data.get("images") or []
-        if not isinstance(imgs, list):
-            raise HTTPException(status_code=400, detail="'images' must be a list of URLs")
-        if len(imgs) > 5:
-            raise HTTPException(status_code=400, detail="Up to 5 images allowed")
-
-    # Whitelist fields that can be updated via this endpoint
-    ALLOWED_FIELDS = {
-        "product_name",
-        "product_description",
-        "price_usd",
-        "category",
-        "brand",
-        "images",
-        "stock_quantity",
-        "is_sold",
-        "size",
-    }
-    safe_update = {k: v for k, v in update_data.items() if k in ALLOWED_FIELDS}
-    safe_update["updated_at"] = datetime.utcnow()
-
+    # Whitelisting and validation come from the ProductUpdate model
+    safe_update = update_data.model_dump(exclude_unset=True)
     if not safe_update:
         return product
+    safe_update["updated_at"] = datetime.now(timezone.utc)
 
     await product.set(safe_update)
     return product
@@ -154,19 +145,14 @@ async def update_product(
 # DELETE - Protected (only seller or admin)
 @router.delete("/{product_id}")
 async def delete_product(
-    product_id: str,
+    oid: PydanticObjectId = Depends(product_oid),
     current_user: User = Depends(get_current_user),
 ):
-    try:
-        oid = PydanticObjectId(product_id)
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid product ID")
-
     product = await Product.get(oid)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
 
-    seller_id = await _extract_seller_id(product)
+    seller_id = _extract_seller_id(product)
     if str(seller_id) != str(current_user.id) and current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Not authorized")
 
@@ -177,19 +163,32 @@ async def delete_product(
 # PATCH mark as SOLD (idempotent)
 @router.patch("/{product_id}/mark_sold", response_model=Product)
 async def mark_product_sold(
-    product_id: str,
+    oid: PydanticObjectId = Depends(product_oid),
     current_user: User = Depends(get_current_user),
 ):
-    try:
-        oid = PydanticObjectId(product_id)
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid product ID")
+    # Common case in one round-trip: authorize and update in the same filter
+    query = {"_id": oid, "is_sold": False}
+    if current_user.role != "admin":
+        query["seller.$id"] = current_user.id
+    updated = await Product.get_motor_collection().find_one_and_update(
+        query,
+        {"$set": {
+            "is_sold": True,
+            "stock_quantity": 0,
+            "updated_at": datetime.now(timezone.utc),
+        }},
+        return_document=ReturnDocument.AFTER,
+    )
+    if updated:
+        return Product.model_validate(updated)
 
+    # Nothing matched: missing, not ours, already sold, or a seller stored in
+    # a legacy (dict / string) shape that "seller.$id" can't match
     product = await Product.get(oid)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
 
-    seller_id = await _extract_seller_id(product)
+    seller_id = _extract_seller_id(product)
     if str(seller_id) != str(current_user.id) and current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Not authorized")
 
@@ -199,6 +198,6 @@ async def mark_product_sold(
     await product.set({
         "is_sold": True,
         "stock_quantity": 0,
-        "updated_at": datetime.utcnow(),
+        "updated_at": datetime.now(timezone.utc),
     })
     return product
@@ -1,7 +1,9 @@
 # routers/uploads.py
+import asyncio
 import os
 from typing import List
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, status
+from fastapi.concurrency import run_in_threadpool
 import cloudinary
 import cloudinary.uploader
 from routers.auth import get_current_user
@@ -12,9 +14,16 @@ router = APIRouter(prefix="/uploads", tags=["uploads"])
 ALLOWED_MIME = {"image/jpeg", "image/png", "image/webp"}
 MAX_BYTES = 5 * 1024 * 1024  # 5MB
 MAX_FILES = 5
+CHUNK_BYTES = 64 * 1024
 
-def ensure_cloudinary_config():
-    cfg = cloudinary.config(cloud_name=None)
+CLOUDINARY_FOLDER = os.getenv("CLOUDINARY_FOLDER", "marketplace")
+
+def _configure_cloudinary() -> bool:
+    """
+    Configure the SDK once at import (env is loaded by main before routers).
+    Returns whether the API key is available.
+    """
+    cfg = cloudinary.config()
     if not cfg.cloud_name or not cfg.api_key:
         cloudinary.config(
             cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
@@ -22,9 +31,34 @@ def ensure_cloudinary_config():
             api_secret=os.getenv("CLOUDINARY_API_SECRET"),
             secure=True,
         )
-    if not os.getenv("CLOUDINARY_API_KEY"):
+    return bool(os.getenv("CLOUDINARY_API_KEY"))
+
+_cloudinary_configured = _configure_cloudinary()
+
+def ensure_cloudinary_config():
+    if not _cloudinary_configured:
         raise HTTPException(status_code=500, detail="Cloudinary API key not loaded from env")
 
+async def check_size(file: UploadFile, detail: str):
+    """
+    Reject files over MAX_BYTES. Starlette's multipart parser records the size
+    while spooling, so the file is only counted chunk by chunk (then rewound)
+    when that is missing.
+    """
+    if file.size is not None:
+        if file.size > MAX_BYTES:
+            raise HTTPException(status_code=400, detail=detail)
+        return
+    size = 0
+    while chunk := await file.read(CHUNK_BYTES):
+        size += len(chunk)
+        if size > MAX_BYTES:
+            raise HTTPException(status_code=400, detail=detail)
+    await file.seek(0)
+
+def _upload(fileobj, folder: str) -> dict:
+    return cloudinary.uploader.upload(fileobj, folder=folder, resource_type="image", overwrite=False)
+
 @router.post("/image")
 async def upload_image(
     file: UploadFile = File(...),
@@ -34,14 +68,10 @@ async def upload_image(
     if file.content_type not in ALLOWED_MIME:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unsupported file type")
 
-    contents = await file.read()
-    if len(contents) > MAX_BYTES:
-        raise HTTPException(status_code=400, detail="Image too large (max 5MB)")
-    await file.seek(0)
+    await check_size(file, "Image too large (max 5MB)")
 
-    folder = os.getenv("CLOUDINARY_FOLDER", "marketplace")
     try:
-        res = cloudinary.uploader.upload(file.file, folder=folder, resource_type="image", overwrite=False)
+        res = await run_in_threadpool(_upload, file.file, CLOUDINARY_FOLDER)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Upload failed: {e}")
 
@@ -56,20 +86,19 @@ async def upload_images(
     if len(files) > MAX_FILES:
         raise HTTPException(status_code=400, detail=f"Max {MAX_FILES} images")
 
-    folder = os.getenv("CLOUDINARY_FOLDER", "marketplace")
-    urls = []
+    # Validate everything before uploading anything
     for f in files:
         if f.content_type not in ALLOWED_MIME:
             raise HTTPException(status_code=400, detail=f"Unsupported type: {f.content_type}")
-        data = await f.read()
-        if len(data) > MAX_BYTES:
-            raise HTTPException(status_code=400, detail=f"Image too large: {f.filename}")
-        await f.seek(0)
+        await check_size(f, f"Image too large: {f.filename}")
 
+    async def upload_one(f: UploadFile):
         try:
-            res = cloudinary.uploader.upload(f.file, folder=folder, resource_type="image", overwrite=False)
-            urls.append({"url": res.get("secure_url"), "public_id": res.get("public_id")})
+            res = await run_in_threadpool(_upload, f.file, CLOUDINARY_FOLDER)
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Upload failed for {f.filename}: {e}")
+        return {"url": res.get("secure_url"), "public_id": res.get("public_id")}
 
+    # The Cloudinary SDK is blocking; run the uploads side by side in the threadpool
+    urls = await asyncio.gather(*(upload_one(f) for f in files))
     return {"items": urls}
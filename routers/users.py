@@ -1,10 +1,10 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from typing import List
 from beanie import PydanticObjectId
-from passlib.context import CryptContext
+from pymongo.errors import DuplicateKeyError
 from models import UserCreate, UserResponse, User, Product
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from routers.auth import pwd_context
 
 router = APIRouter(
     prefix="/users",
@@ -16,23 +16,20 @@ def truncate_password(password: str) -> str:
     Truncate password safely to 72 bytes for bcrypt.
     Handles multi-byte characters.
     """
+    # ASCII is one byte per char: slice without encoding at all
+    if password.isascii():
+        return password[:72]
     encoded = password.encode("utf-8")
-    if len(encoded) > 72:
-        encoded = encoded[:72]
-        password = encoded.decode("utf-8", "ignore")
-    return password
+    if len(encoded) <= 72:
+        return password
+    return encoded[:72].decode("utf-8", "ignore")
 
 
-@router.post("/", response_model=User)
+@router.post("/", response_model=UserResponse)
 async def create_user(user: UserCreate):
-    # Check if user already exists
-    existing_user = await User.find_one(User.email == user.email)
-    if existing_user:
-        raise HTTPException(status_code=400, detail="Email already registered")
-
     # Safely hash password (truncate to 72 bytes)
     safe_password = truncate_password(user.password)
-    hashed_pw = pwd_context.hash(safe_password)
+    hashed_pw = await run_in_threadpool(pwd_context.hash, safe_password)
 
     # Create user document
     db_user = User(
@@ -43,10 +40,14 @@ async def create_user(user: UserCreate):
         phone_number=user.phone_number,
         address=user.address
     )
-    await db_user.insert()
+    # Uniqueness is enforced by the email index
+    try:
+        await db_user.insert()
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email already registered")
     return db_user
 
-@router.get("/{user_id}", response_model=User)
+@router.get("/{user_id}", response_model=UserResponse)
 async def get_user(user_id: str):
     try:
         user_oid = PydanticObjectId(user_id)
@@ -69,7 +70,8 @@ async def get_user_products(user_id: str):
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    products = await Product.find(Product.seller.id == user_oid).to_list()
+    # Plain match on the stored DBRef id (indexed); never join sellers in
+    products = await Product.find({"seller.$id": user_oid}, fetch_links=False).to_list()
     return products
 
 # Public profile: safe, minimal fields